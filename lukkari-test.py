@@ -7,9 +7,35 @@ if sys.version_info[0] != 3 or sys.version_info[1] < 6:
     print("Was: {}.{}".format(sys.version_info[0], sys.version_info[1]))
     exit(1)
 
+import contextlib
+import datetime
+import io
+import os
+import tempfile
 import unittest
 import utulukkari
 
+TEST_LUKKARI = """
+TKO_3104
+Data ja vuorovaikutus
+ti 01.09.2020 10:15-12:00 Etäopetus
+to 03.09.2020 10:15-12:00 Etäopetus
+
+DTEK0066
+Olio-ohjelmoinnin jatkokurssi
+ti 01.09.2020 12:15-14:00 Etäopetus
+pe 04.09.2020 10:15-12:00 Etäopetus
+"""
+
+
+def write_lukkari(content: str) -> str:
+    """ Write the content to a temporary lukkari file and return its path """
+
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "w") as lukkari_file:
+        lukkari_file.write(content)
+    return path
+
 
 class LukkariTests(unittest.TestCase):
     """ The main class for test cases """
@@ -21,6 +47,230 @@ class LukkariTests(unittest.TestCase):
         self.assertEqual(utulukkari.WIN_HEIGHT, -1)
         self.assertEqual(utulukkari.DEBUG, False)
 
+    def test_course_time_start_end(self):
+        """ Make sure that the lecture times are parsed to datetimes """
+
+        time = utulukkari.CourseTime.str_to_time("ti 01.09.2020 10:15-12:00 Etäopetus")
+        start, end = time.start_end()
+        self.assertEqual(start, datetime.datetime(2020, 9, 1, 10, 15))
+        self.assertEqual(end, datetime.datetime(2020, 9, 1, 12, 0))
+
+        time = utulukkari.CourseTime.str_to_time("ti 01.09.2020 - Etäopetus")
+        self.assertEqual(time.start_end(), (None, None))
+
+    def test_notifier_pop_due(self):
+        """ Make sure that reminders are popped in order when they are due """
+
+        path = write_lukkari(TEST_LUKKARI)
+        self.addCleanup(os.remove, path)
+
+        notifier = utulukkari.LectureNotifier(path, before=10)
+        notifier.load(datetime.datetime(2020, 9, 1, 11, 0))
+        # The first lecture has already started
+        self.assertEqual(len(notifier.heap), 3)
+
+        due = notifier.pop_due(datetime.datetime(2020, 9, 1, 12, 5))
+        self.assertEqual([course.cid for course in due], ["DTEK0066"])
+        self.assertEqual(len(notifier.heap), 2)
+
+        # Missed reminders are dropped
+        due = notifier.pop_due(datetime.datetime(2020, 9, 5, 0, 0))
+        self.assertEqual(due, [])
+        self.assertEqual(notifier.heap, [])
+
+    def test_notifier_reload_changed(self):
+        """ Make sure that only the changed courses are rebuilt on reload """
+
+        path = write_lukkari(TEST_LUKKARI)
+        self.addCleanup(os.remove, path)
+
+        now = datetime.datetime(2020, 8, 1)
+        notifier = utulukkari.LectureNotifier(path)
+        notifier.load(now)
+        kept = [entry for entry in notifier.heap if entry[3].cid == "TKO_3104"]
+
+        with open(path, "w") as lukkari_file:
+            lukkari_file.write(TEST_LUKKARI.replace("pe 04.09.2020", "pe 11.09.2020"))
+        notifier.load(now)
+
+        self.assertEqual(len(notifier.heap), 4)
+        for entry in kept:
+            self.assertIn(entry, notifier.heap)
+        days = sorted(entry[3].time.day for entry in notifier.heap
+                      if entry[3].cid == "DTEK0066")
+        self.assertEqual(days, ["01.09.2020", "11.09.2020"])
+
+    def test_notifier_sleep_time(self):
+        """ Make sure that the notifier sleeps until the next reminder """
+
+        path = write_lukkari(TEST_LUKKARI)
+        self.addCleanup(os.remove, path)
+
+        now = datetime.datetime(2020, 9, 1, 7, 0)
+        notifier = utulukkari.LectureNotifier(path, before=10)
+        notifier.load(now)
+        # First reminder is at 10:05
+        self.assertEqual(notifier.sleep_time(now), 3 * 60 * 60 + 5 * 60)
+
+        notifier.check_interval = 60 * 60
+        self.assertEqual(notifier.sleep_time(now), 60 * 60)
+
+        notifier.pop_due(datetime.datetime(2020, 9, 5))
+        self.assertEqual(notifier.sleep_time(now), 60 * 60)
+        notifier.check_interval = 0
+        self.assertIsNone(notifier.sleep_time(now))
+
+    def test_notifier_edit_after_sent(self):
+        """ Make sure that editing a course doesn't send its reminders again """
+
+        path = write_lukkari(TEST_LUKKARI)
+        self.addCleanup(os.remove, path)
+
+        notifier = utulukkari.LectureNotifier(path, before=10)
+        notifier.load(datetime.datetime(2020, 9, 1, 9, 0))
+
+        due = notifier.pop_due(datetime.datetime(2020, 9, 1, 10, 6))
+        self.assertEqual([course.cid for course in due], ["TKO_3104"])
+
+        with open(path, "w") as lukkari_file:
+            lukkari_file.write(TEST_LUKKARI.replace("to 03.09.2020", "to 10.09.2020"))
+        notifier.load(datetime.datetime(2020, 9, 1, 10, 7))
+
+        self.assertEqual(notifier.pop_due(datetime.datetime(2020, 9, 1, 10, 8)), [])
+        days = sorted(entry[3].time.day for entry in notifier.heap
+                      if entry[3].cid == "TKO_3104")
+        self.assertEqual(days, ["10.09.2020"])
+
+    def test_notifier_reload_broken_file(self):
+        """ Make sure that a broken lukkari file doesn't stop the notifier """
+
+        path = write_lukkari(TEST_LUKKARI)
+        self.addCleanup(os.remove, path)
+
+        now = datetime.datetime(2020, 8, 1)
+        notifier = utulukkari.LectureNotifier(path)
+        notifier.load(now)
+        heap = list(notifier.heap)
+
+        with open(path, "w") as lukkari_file:
+            lukkari_file.write(TEST_LUKKARI + "\nX1\nBroken\nti 01.09.2020\n")
+        os.utime(path, (0, 0))
+
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            notifier.reload(now)
+
+        self.assertIn("Error:", stderr.getvalue())
+        self.assertEqual(notifier.heap, heap)
+        # The file is read again on the next check
+        self.assertTrue(notifier.file_changed())
+
+    def test_notifier_command_failure(self):
+        """ Make sure that a failing notify command doesn't raise """
+
+        course = utulukkari.Course(
+            "Data ja vuorovaikutus", "TKO_3104", "ti 01.09.2020 10:15-12:00 Etäopetus")
+        notifier = utulukkari.LectureNotifier(
+            "lukkari.txt.example", command="utu-lukkari-missing-command")
+
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            notifier.notify(course)
+
+        self.assertIn("Error:", stderr.getvalue())
+
+        # Commands that hang are killed after the timeout
+        notifier.command = "sh -c 'sleep 5'"
+        notifier.command_timeout = 0.1
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            notifier.notify(course)
+
+        self.assertIn("timed out", stderr.getvalue())
+
+    def test_aggregate_hours(self):
+        """ Make sure that lecture hours are summed per course, week and place """
+
+        path = write_lukkari(TEST_LUKKARI)
+        self.addCleanup(os.remove, path)
+        self.addCleanup(utulukkari.COURSES.clear)
+        utulukkari.COURSES.clear()
+        utulukkari.parse_lukkari_file(path)
+
+        totals = utulukkari.aggregate_hours()
+        self.assertEqual(totals["course"], {
+            "TKO_3104": [2, 210], "DTEK0066": [2, 210]})
+        self.assertEqual(totals["week"], {"2020-W36": [4, 420]})
+        self.assertEqual(totals["place"], {"Etäopetus": [4, 420]})
+
+        self.assertEqual(utulukkari.format_report(totals).splitlines(), [
+            "Course    Lectures     Hours",
+            "DTEK0066         2      3.50",
+            "TKO_3104         2      3.50",
+            "",
+            "Week      Lectures     Hours",
+            "2020-W36         4      7.00",
+            "",
+            "Place      Lectures     Hours",
+            "Etäopetus         4      7.00",
+        ])
+
+        totals = utulukkari.aggregate_hours(
+            datetime.datetime(2020, 9, 2), datetime.datetime(2020, 9, 3))
+        self.assertEqual(totals["course"], {"TKO_3104": [1, 105]})
+
+        report = utulukkari.format_report(totals, csv_output=True)
+        self.assertEqual(report.splitlines(), [
+            "group,key,lectures,hours",
+            "course,TKO_3104,1,1.75",
+            "week,2020-W36,1,1.75",
+            "place,Etäopetus,1,1.75",
+        ])
+
+    def test_aggregate_hours_invalid(self):
+        """ Make sure that lectures with invalid date or time are skipped """
+
+        path = write_lukkari(
+            "X1\nBroken\nti 01.09.2020 25:99-26:00 Etäopetus\n"
+            "ti 32.09.2020 10:15-12:00 Etäopetus\n"
+            "ti 08.09.2020 10:15-12:00 Etäopetus\n"
+            "ti 09.09.2020 10:15-12:00\n")
+        self.addCleanup(os.remove, path)
+        self.addCleanup(utulukkari.COURSES.clear)
+        utulukkari.COURSES.clear()
+        utulukkari.parse_lukkari_file(path)
+
+        totals = utulukkari.aggregate_hours()
+        self.assertEqual(totals["skipped"], 2)
+        self.assertEqual(totals["course"], {"X1": [2, 210]})
+        self.assertEqual(totals["week"], {"2020-W37": [2, 210]})
+        # Lectures without a place are grouped under "-"
+        self.assertEqual(totals["place"], {"Etäopetus": [1, 105], "-": [1, 105]})
+
+    def test_month_grid(self):
+        """ Make sure that the month grid has full weeks with neighbour month days """
+
+        grid = utulukkari.month_grid(2020, 9)
+        self.assertIs(grid, utulukkari.month_grid(2020, 9))
+        self.assertEqual(len(grid), 5)
+        self.assertTrue(all(len(week) == 7 for week in grid))
+
+        # September 2020 starts on tuesday and ends on wednesday
+        self.assertEqual(grid[0][0], ("31.08.2020", 0, False))
+        self.assertEqual(grid[0][1], ("01.09.2020", 1, True))
+        self.assertEqual(grid[-1][2], ("30.09.2020", 2, True))
+        self.assertEqual(grid[-1][-1], ("04.10.2020", 6, False))
+
+        self.assertEqual(
+            utulukkari.week_row(datetime.datetime(2020, 9, 6)), grid[0])
+        self.assertEqual(
+            utulukkari.week_row(datetime.datetime(2020, 9, 7)), grid[1])
+
+        # August 2020 starts on saturday and ends on monday
+        grid = utulukkari.month_grid(2020, 8)
+        self.assertEqual(grid[0][5], ("01.08.2020", 5, True))
+        self.assertEqual(grid[-1][0], ("31.08.2020", 0, True))
+        self.assertEqual(grid[-1][1], ("01.09.2020", 1, False))
 
 if __name__ == "__main__":
     unittest.main()
@@ -2,13 +2,21 @@
 
 import argparse
 import calendar
+import csv
 import curses
 import datetime
+import functools
+import heapq
+import io
 import os
+import shlex
+import shutil
 import signal
+import subprocess
 import sys
 
 DATE_FORMAT = "%d.%m.%Y"
+TIME_FORMAT = "%H:%M"
 
 COURSES = {}
 
@@ -127,6 +135,24 @@ class CourseTime:
 
         return CourseTime(day, time, place, day_name)
 
+    def start_end(self) -> tuple:
+        """
+        Return the (start, end) datetime objects of the lecture
+        or (None, None) if the day or time is not in the expected format
+        """
+
+        try:
+            start, end = self.time.split("-")
+            day = datetime.datetime.strptime(self.day, DATE_FORMAT)
+            start = datetime.datetime.strptime(start, TIME_FORMAT)
+            end = datetime.datetime.strptime(end, TIME_FORMAT)
+        except ValueError:
+            return (None, None)
+
+        start = day.replace(hour=start.hour, minute=start.minute)
+        end = day.replace(hour=end.hour, minute=end.minute)
+        return (start, end)
+
 
 class Course:
     def __init__(self, name: str, cid: str, time: str):
@@ -377,7 +403,7 @@ class DateDrawer:
         self.draw_mode = "week"
         self.window.clear()
 
-        week_dates = generate_dates("week")[:5]
+        week_dates = [date for date, _, _ in week_row(CURRENT_DAY)[:5]]
 
         # We want all 5 dates to to our draw list regradless of
         # how many columns we can draw
@@ -445,7 +471,18 @@ class DateDrawer:
         self.draw_mode = "month"
         self.window.clear()
 
-        month_dates = generate_dates("month")
+        grid = month_grid(CURRENT_DAY.year, CURRENT_DAY.month)
+        # The first and last weeks contain the first and last day of the month
+        first_day = next(date for date, _, in_month in grid[0] if in_month)
+        last_day = next(
+            date for date, _, in_month in reversed(grid[-1]) if in_month)
+
+        # Only show the weeks that have weekdays in the current month
+        weeks = []
+        for week in grid:
+            week = week[:5]  # Skip saturday and sunday
+            if any(in_month for _, _, in_month in week):
+                weeks.append(week)
 
         compact_column_size = int(self.maxx / 5)
         if compact_column_size >= 20:
@@ -454,79 +491,248 @@ class DateDrawer:
         else:
             compact_column_text_len = compact_column_size - 1
 
-        # TODO: show the last days of prev month and first days of next month
-        #       if the first day is not monday and/or last day is not friday-sunday
         # TODO: make a single lecture selectable so we can show the full info
         # TODO: show month column by column if the screen is too small
         # TODO: do we need to support weekends?
 
         self.reset_xy()
-        self.draw_string(f"{month_dates[0][0]} - {month_dates[-1][0]}")
+        self.draw_string(f"{first_day} - {last_day}")
+
+        if init:
+            self.draw_link_list = [
+                [date for date, _, _ in week] for week in weeks]
 
         self.current_y = 2
-        max_lines_week = 1  # There is atleast the "No lectures!" line
-        # Keep track where to put dates when initializeing draw_link_list
-        draw_date_index = 0
-        for _date in month_dates:
-            date, week_day = _date
-            if week_day == 5 or week_day == 6:  # Skip saturday and sunday
+        for week in weeks:
+            max_lines_week = 1  # There is atleast the "No lectures!" line
+            for date, week_day, in_month in week:
+                highlight = True
+
+                lx = self.draw_link_x
+                ly = self.draw_link_y
+                if lx == -1 or ly == -1:
+                    highlight = False
+                elif self.draw_link_list[ly][lx] != date:
+                    highlight = False
+
+                self.current_x = compact_column_size * week_day
+                if highlight:
+                    self.turn_highlight_on()
+                elif not in_month:  # Dim the days of prev and next month
+                    self.window.attron(curses.A_DIM)
+                self.draw_string(date[:6])
+                if highlight:
+                    self.turn_highlight_off()
+                elif not in_month:
+                    self.window.attroff(curses.A_DIM)
+                courses = course_wrap(date)
+                courses_len = len(courses)
+                if courses_len == 0:
+                    self.current_y += 1
+                    self.draw_string("No lectures!", compact_column_text_len)
+                    self.current_y -= 1
+
+                if courses_len > max_lines_week:
+                    max_lines_week = courses_len
+
+                for course in courses:
+                    self.current_y += 1
+                    self.draw_string(
+                        f"{course.time.time[:2]} {course.name}",
+                        compact_column_text_len
+                    )
+
+                self.current_y -= courses_len
+
+            # Move to next week after friday
+            self.current_y += max_lines_week + 2
+
+        self.window.refresh()
+
+
+class LectureNotifier:
+    """
+    Long running notifier that reminds about the upcoming lectures.
+
+    Reminders are kept in a heap ordered by the reminder time so the
+    notifier only needs to wake up when the next reminder is due.
+    The lukkari file is checked for changes when the notifier wakes up,
+    when it receives SIGHUP and optionally every check_interval minutes.
+    """
+
+    # Seconds the notify command is allowed to run before it's killed
+    command_timeout = 10
+
+    def __init__(self, file_path: str, before: int = 10, command: str = None,
+                 check_interval: int = 0):
+        self.file_path = file_path
+        # Minutes before the lecture the reminder is sent
+        self.before = datetime.timedelta(minutes=before)
+        # Shell command that gets the reminder as the last argument.
+        # When None, the reminders are printed to stdout
+        self.command = command
+        # Seconds between the file checks, 0 only checks on the wake ups
+        self.check_interval = check_interval * 60
+
+        # Heap of (reminder time, lecture start, counter, Course)
+        # The counter keeps the Course objects from being compared
+        self.heap = []
+        self.counter = 0
+        # Lecture lines of each course id, used to find the changed courses
+        self.lectures = {}
+        # (course id, lecture start) of the reminders that have been sent,
+        # so editing a course doesn't send the same reminders again
+        self.sent = set()
+        self.file_mtime = None
+
+    def push_lectures(self, courses: list, now: datetime.datetime):
+        """ Add the reminders of the lectures that haven't started yet """
+        for course in courses:
+            start, _ = course.time.start_end()
+            if start is None or start <= now:
+                continue
+            if (course.cid, start) in self.sent:
                 continue
-            highlight = True
 
-            if init:
-                if len(self.draw_link_list) - 1 < draw_date_index:
-                    # Add empties to start if week doesn't start on monday
-                    if week_day != 0:
-                        self.draw_link_list.append([-1] * week_day)
-                        self.draw_link_list[draw_date_index].append(date)
-                    else:
-                        self.draw_link_list.append([date])
-                else:
-                    self.draw_link_list[draw_date_index].append(date)
-                highlight = False
+            entry = (start - self.before, start, self.counter, course)
+            heapq.heappush(self.heap, entry)
+            self.counter += 1
 
-            lx = self.draw_link_x
-            ly = self.draw_link_y
-            if lx == -1 or ly == -1:
-                highlight = False
-            elif self.draw_link_list[ly][lx] != date:
-                highlight = False
+    def load(self, now: datetime.datetime):
+        """
+        Read the lukkari file and rebuild the reminders of the courses
+        that have been added, removed or changed since the last load
+        """
 
-            self.current_x = compact_column_size * week_day
-            if highlight:
-                self.turn_highlight_on()
-            self.draw_string(date[:6])
-            if highlight:
-                self.turn_highlight_off()
-            courses = course_wrap(date)
-            courses_len = len(courses)
-            if courses_len == 0:
-                self.current_y += 1
-                self.draw_string("No lectures!", compact_column_text_len)
-                self.current_y -= 1
+        file_mtime = os.stat(self.file_path).st_mtime
 
-            if courses_len > max_lines_week:
-                max_lines_week = courses_len
+        courses = {}
+        for course in read_lukkari_file(self.file_path):
+            if not course.cid in courses:
+                courses[course.cid] = [course]
+            else:
+                courses[course.cid].append(course)
 
-            for course in courses:
-                self.current_y += 1
-                self.draw_string(
-                    f"{course.time.time[:2]} {course.name}",
-                    compact_column_text_len
-                )
+        # Only update the mtime after a succesful parse so a broken file
+        # is read again on the next check
+        self.file_mtime = file_mtime
+        self.sent = {sent for sent in self.sent if sent[1] > now}
 
-            self.current_y -= courses_len
+        lectures = {}
+        for cid, cid_courses in courses.items():
+            lectures[cid] = sorted(str(course) for course in cid_courses)
 
-            if week_day == 4:  # Move to next week after friday
-                self.current_y += max_lines_week + 2
-                max_lines_week = 1  # There is atleast the "No lectures!" line
-                draw_date_index += 1
+        changed = set(lectures.keys()) ^ set(self.lectures.keys())
+        for cid in lectures.keys() & self.lectures.keys():
+            if lectures[cid] != self.lectures[cid]:
+                changed.add(cid)
+        self.lectures = lectures
 
-        self.window.refresh()
+        if len(changed) == 0:
+            return
+
+        # Only remove the reminders of the changed courses and keep the rest
+        self.heap = [entry for entry in self.heap
+                     if not entry[3].cid in changed]
+        heapq.heapify(self.heap)
+
+        for cid in changed:
+            self.push_lectures(courses.get(cid, []), now)
+
+    def reload(self, now: datetime.datetime):
+        """
+        Load the changed lukkari file. If the file can't be read,
+        the current reminders are kept and the load is tried again
+        on the next file check
+        """
+
+        try:
+            self.load(now)
+        except (IndexError, OSError, UnicodeDecodeError) as e:
+            print(f"Error: Failed to reload {self.file_path}: {e}",
+                  file=sys.stderr, flush=True)
+
+    def file_changed(self) -> bool:
+        try:
+            return os.stat(self.file_path).st_mtime != self.file_mtime
+        except OSError:
+            return False
+
+    def pop_due(self, now: datetime.datetime) -> list:
+        """
+        Return the Course objects whose reminders are due.
+        Lectures that have already started are dropped silently
+        """
+
+        due = []
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            _, start, _, course = heapq.heappop(self.heap)
+            if start > now:
+                self.sent.add((course.cid, start))
+                due.append(course)
+
+        return due
+
+    def notify(self, course: Course):
+        message = f"{course.time.day} {course.time.time} " \
+            f"{course.name} {course.cid} {course.time.place}"
+        if self.command:
+            try:
+                subprocess.run(shlex.split(self.command) + [message],
+                               timeout=self.command_timeout)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                print(f"Error: Failed to send reminder: {e}",
+                      file=sys.stderr, flush=True)
+        else:
+            print(message, flush=True)
+
+    def sleep_time(self, now: datetime.datetime) -> float:
+        """
+        Return the seconds until the next reminder or the next file check,
+        whichever comes first. None means there is nothing to wait for
+        """
+
+        timeout = None
+        if len(self.heap) > 0:
+            timeout = max((self.heap[0][0] - now).total_seconds(), 0)
+        if self.check_interval > 0:
+            if timeout is None or self.check_interval < timeout:
+                timeout = self.check_interval
+
+        return timeout
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Sleep for timeout seconds, or a day if timeout is None.
+        Returns True if the sleep was cut short by SIGHUP
+        """
+
+        # sigwait would never return on SIGINT so always use a timeout
+        if timeout is None:
+            timeout = 24 * 60 * 60
+
+        return signal.sigtimedwait([signal.SIGHUP], timeout) is not None
+
+    def run(self):
+        """
+        Send the reminders until interrupted.
+        The lukkari file has to be loaded before calling this
+        """
+
+        # SIGHUP is only received through wait so it can end the sleep
+        signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGHUP])
+        while True:
+            now = datetime.datetime.now()
+            for course in self.pop_due(now):
+                self.notify(course)
 
+            hangup = self.wait(self.sleep_time(now))
+            if hangup or self.file_changed():
+                self.reload(datetime.datetime.now())
 
-def parse_lukkari_file(file_path: str):
-    global COURSES
+
+def read_lukkari_file(file_path: str) -> list:
+    """ Return all the lectures in the lukkari file as a list of Course objects """
 
     file_lines = []
     with open(file_path) as lukkari_file:
@@ -536,6 +742,7 @@ def parse_lukkari_file(file_path: str):
     tunnus = None
     nimi_found = False
     nimi = None
+    courses = []
 
     for line in file_lines:
         line = line.strip()
@@ -562,7 +769,15 @@ def parse_lukkari_file(file_path: str):
             continue
 
         # The rest of the lines are the course hours
-        course = Course(nimi, tunnus, line)
+        courses.append(Course(nimi, tunnus, line))
+
+    return courses
+
+
+def parse_lukkari_file(file_path: str):
+    global COURSES
+
+    for course in read_lukkari_file(file_path):
         if not course.time.day in COURSES:
             COURSES[course.time.day] = [course]
         else:
@@ -573,16 +788,39 @@ def parse_lukkari_file(file_path: str):
         COURSES[key].sort(key=lambda course: course.time.time)
 
 
+@functools.lru_cache(maxsize=24)
+def month_grid(year: int, month: int) -> tuple:
+    """
+    Return the full weeks (monday to sunday) of the month including
+    the days of the previous and the next month.
+    Each week is a tuple of (date, weekday, in_month) tuples
+
+    The grid is cached so paging through months doesn't format the dates again
+    """
+
+    weeks = []
+    for week in calendar.Calendar().monthdatescalendar(year, month):
+        weeks.append(tuple(
+            (day.strftime(DATE_FORMAT), day.weekday(), day.month == month)
+            for day in week
+        ))
+
+    return tuple(weeks)
+
+
+def week_row(day: datetime.datetime) -> tuple:
+    """ Return the week of the month_grid that the day belongs to """
+
+    first_weekday = calendar.monthrange(day.year, day.month)[0]
+    return month_grid(day.year, day.month)[(day.day + first_weekday - 1) // 7]
+
+
 def generate_dates(keyword: str = None) -> list:
     """
     Generate dates based on keyword
     today / now / None: only todays date
 
-    week: all dates belonging to the week we are currently living
-
-    month: all dates belonging to the month we are currently living
-
-    Note that month returns tuple with (date, weekday)
+    The dates of the week and month views come from month_grid
 
     TODO: date-str: courses based on date-str
     """
@@ -592,42 +830,100 @@ def generate_dates(keyword: str = None) -> list:
         dates.append(CURRENT_DAY.strftime(DATE_FORMAT))
     elif keyword == "today" or keyword == "now":
         dates.append(CURRENT_DAY.strftime(DATE_FORMAT))
-    elif keyword == "week":
-        # 0 is monday, 6 is sunday
-        weekday = calendar.weekday(
-            CURRENT_DAY.year, CURRENT_DAY.month, CURRENT_DAY.day)
-
-        # Get today, and days before
-        for i in range(weekday, 0, -1):
-            day = CURRENT_DAY + datetime.timedelta(-i)
-            dates.append(day.strftime(DATE_FORMAT))
-
-        # Get days after
-        for i in range(7 - weekday):
-            day = CURRENT_DAY + datetime.timedelta(i)
-            dates.append(day.strftime(DATE_FORMAT))
-
-    elif keyword == "month":
-        # Month days start from 1
-        month_day = CURRENT_DAY.day
-        month_max = calendar.monthrange(CURRENT_DAY.year, CURRENT_DAY.month)[1]
-
-        # Get today, and days before
-        for i in range(month_day - 1, 0, -1):
-            day = CURRENT_DAY + datetime.timedelta(-i)
-            dates.append((day.strftime(DATE_FORMAT), day.weekday()))
-
-        # Get days after
-        for i in range((month_max + 1) - month_day):
-            day = CURRENT_DAY + datetime.timedelta(i)
-            dates.append((day.strftime(DATE_FORMAT), day.weekday()))
-
     else:
         print(f"Invalid date keyword: {keyword}")
 
     return dates
 
 
+def aggregate_hours(start: datetime.datetime = None,
+                    end: datetime.datetime = None) -> dict:
+    """
+    Count the lectures and minutes in COURSES between start and end
+    (both inclusive) per course id, per ISO week and per place
+
+    Returns dict with "course", "week" and "place" keys where each value is
+    a dict of key -> [lectures, minutes]. Lectures with invalid date or time
+    are left out of the totals and their count is in the "skipped" key
+    """
+
+    totals = {"course": {}, "week": {}, "place": {}, "skipped": 0}
+    # Lectures usually share a handful of time ranges
+    minutes_cache = {}
+
+    # COURSES is grouped by day so every date is parsed only once
+    for day_str, courses in COURSES.items():
+        try:
+            day = datetime.datetime.strptime(day_str, DATE_FORMAT)
+        except ValueError:
+            totals["skipped"] += len(courses)
+            continue
+
+        if start and day < start:
+            continue
+        if end and day > end:
+            continue
+
+        iso_year, iso_week, _ = day.isocalendar()
+        week_key = f"{iso_year}-W{iso_week:02d}"
+
+        for course in courses:
+            time_range = course.time.time
+            if not time_range in minutes_cache:
+                lecture_start, lecture_end = course.time.start_end()
+                minutes = None
+                if lecture_start is not None and lecture_end >= lecture_start:
+                    duration = lecture_end - lecture_start
+                    minutes = int(duration.total_seconds()) // 60
+                minutes_cache[time_range] = minutes
+            minutes = minutes_cache[time_range]
+
+            if minutes is None:
+                totals["skipped"] += 1
+                continue
+
+            for group, key in (("course", course.cid),
+                               ("week", week_key),
+                               ("place", course.time.place or "-")):
+                total = totals[group].get(key)
+                if total is None:
+                    totals[group][key] = [1, minutes]
+                else:
+                    total[0] += 1
+                    total[1] += minutes
+
+    return totals
+
+
+def format_report(totals: dict, csv_output: bool = False) -> str:
+    """ Format the aggregate_hours result as a table or as csv """
+
+    groups = (("course", "Course"), ("week", "Week"), ("place", "Place"))
+
+    if csv_output:
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["group", "key", "lectures", "hours"])
+        for group, _ in groups:
+            for key in sorted(totals[group].keys()):
+                lectures, minutes = totals[group][key]
+                writer.writerow([group, key, lectures, f"{minutes / 60:.2f}"])
+        return output.getvalue()
+
+    lines = []
+    for group, title in groups:
+        rows = sorted(totals[group].items())
+        key_len = max([len(title)] + [len(key) for key, _ in rows])
+
+        lines.append(f"{title.ljust(key_len)}  {'Lectures':>8}  {'Hours':>8}")
+        for key, (lectures, minutes) in rows:
+            lines.append(
+                f"{key.ljust(key_len)}  {lectures:>8}  {minutes / 60:>8.2f}")
+        lines.append("")
+
+    return "\n".join(lines)
+
+
 def get_home_lukkari_path():
     """
     Make sure that the lukkari.text file exists
@@ -662,18 +958,87 @@ def interrupt_handler(signal_received, frame):
 
 
 def main():
-    signal.signal(signal.SIGINT, interrupt_handler)
-
     # Always set the program name as the executable name
     parser = argparse.ArgumentParser(prog=sys.argv[0])
     parser.add_argument('-p', '--path', default=None,
                         type=str, help="Path to lukkari file")
+    parser.add_argument('--notify', action='store_true',
+                        help="Run in the background and remind about lectures")
+    parser.add_argument('--notify-before', default=10, type=int,
+                        help="Minutes before the lecture the reminder is sent")
+    parser.add_argument('--notify-command', default=None, type=str,
+                        help="Command that gets the reminder as the last argument")
+    parser.add_argument('--notify-check-interval', default=0, type=int,
+                        help="Minutes between lukkari file checks (0 = never)")
+    parser.add_argument('--report', action='store_true',
+                        help="Print lecture hours per course, week and place")
+    parser.add_argument('--start', default=None, type=str,
+                        help="First day of the report (dd.mm.yyyy)")
+    parser.add_argument('--end', default=None, type=str,
+                        help="Last day of the report (dd.mm.yyyy)")
+    parser.add_argument('--csv', action='store_true',
+                        help="Print the report as csv")
     arguments = parser.parse_args()
 
     lukkari_path = arguments.path
     if lukkari_path == None:
         lukkari_path = get_home_lukkari_path()
 
+    if arguments.notify:
+        if arguments.notify_before < 0:
+            print("Error: --notify-before can't be negative")
+            sys.exit(1)
+        if arguments.notify_check_interval < 0:
+            print("Error: --notify-check-interval can't be negative")
+            sys.exit(1)
+
+        command = arguments.notify_command
+        if command is not None:
+            try:
+                command_parts = shlex.split(command)
+            except ValueError:
+                command_parts = []
+            if len(command_parts) == 0 or not shutil.which(command_parts[0]):
+                print(f"Error: Invalid notify command: {command}")
+                sys.exit(1)
+
+        notifier = LectureNotifier(
+            lukkari_path, arguments.notify_before, arguments.notify_command,
+            arguments.notify_check_interval)
+        try:
+            notifier.load(datetime.datetime.now())
+        except (IndexError, OSError, UnicodeDecodeError) as e:
+            print(f"Error: Failed to load {lukkari_path}: {e}")
+            sys.exit(1)
+
+        try:
+            notifier.run()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if arguments.report:
+        try:
+            start = arguments.start
+            if start:
+                start = datetime.datetime.strptime(start, DATE_FORMAT)
+            end = arguments.end
+            if end:
+                end = datetime.datetime.strptime(end, DATE_FORMAT)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+        parse_lukkari_file(lukkari_path)
+        totals = aggregate_hours(start, end)
+        if totals["skipped"] > 0:
+            print(f"Warning: Skipped {totals['skipped']} lectures "
+                  "with invalid date or time", file=sys.stderr)
+        print(format_report(totals, arguments.csv), end="")
+        return
+
+    signal.signal(signal.SIGINT, interrupt_handler)
+
     parse_lukkari_file(lukkari_path)
 
     drawer = DateDrawer()